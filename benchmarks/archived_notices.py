@@ -0,0 +1,85 @@
+"""
+Rows matched and latencies of the notice queries of a user with a large
+archived history, with the ``archived`` filter of NoticeManager.notices_for
+left out (as it was before it reached the SQL) and with it applied.
+
+    DJANGO_SETTINGS_MODULE=myproject.bench_settings python benchmarks/archived_notices.py --rows 1000000
+"""
+from optparse import OptionParser
+
+import common
+
+
+def queries(user, archived_filter):
+    from notification.models import Notice
+    from notification.feeds import NoticeUserFeed, ITEMS_PER_FEED
+
+    if archived_filter:
+        notices_for = Notice.objects.notices_for
+        feed = NoticeUserFeed(None, None).items(user)
+    else:
+        def notices_for(user, unseen=None, on_site=None):
+            qs = Notice.objects.filter(recipient=user)
+            if unseen is not None:
+                qs = qs.filter(unseen=unseen)
+            if on_site is not None:
+                qs = qs.filter(on_site=on_site)
+            return qs
+        feed = notices_for(user).order_by("-added")[:ITEMS_PER_FEED]
+    inbox = notices_for(user, on_site=True)
+    unseen = notices_for(user, unseen=True, on_site=True)
+    return [
+        ("inbox", inbox, lambda: list(inbox[:15])),
+        ("unseen_count_for", unseen, lambda: unseen.count()),
+        ("NoticeUserFeed.items", feed, lambda: list(feed)),
+    ]
+
+
+def matched_rows(queryset):
+    """
+    Returns the number of rows matching the filters of ``queryset``, before
+    they are ordered and sliced.
+    """
+    queryset = queryset._clone()
+    queryset.query.clear_limits()
+    queryset.query.clear_ordering(force_empty=True)
+    return queryset.count()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=1000000,
+                      help="number of notices to create")
+    parser.add_option("--users", type="int", default=100,
+                      help="number of users to spread the notices over")
+    parser.add_option("--archived", type="float", default=0.95,
+                      help="ratio of archived notices")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="number of runs per query, the best one is reported")
+    options, args = parser.parse_args()
+
+    common.setup()
+
+    users = common.create_users(options.users)
+    notice_type = common.populate(options.rows, users, archived=options.archived)
+    try:
+        before = common.report("without the archived filter",
+                               queries(users[0], False), options.repeat)
+        after = common.report("with the archived filter",
+                              queries(users[0], True), options.repeat)
+        rows_before = [matched_rows(queryset) for name, queryset, func in queries(users[0], False)]
+        rows_after = [matched_rows(queryset) for name, queryset, func in queries(users[0], True)]
+    finally:
+        common.cleanup(notice_type)
+
+    print "=" * 72
+    print "%-22s %10s %10s %12s %12s" % (
+        "query", "rows before", "rows after", "before (ms)", "after (ms)")
+    for (name, elapsed_before), (name, elapsed_after), count_before, count_after in zip(
+            before, after, rows_before, rows_after):
+        print "%-22s %10s %10s %12.2f %12.2f" % (
+            name, count_before, count_after, elapsed_before, elapsed_after)
+
+
+if __name__ == "__main__":
+    main()
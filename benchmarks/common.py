@@ -0,0 +1,156 @@
+"""
+Helpers shared by the benchmarks.
+
+The benchmarks fill the database of the configured project with users and
+notices and delete them again when they are done. Run them against a scratch
+copy of your database, e.g.::
+
+    DJANGO_SETTINGS_MODULE=myproject.bench_settings python benchmarks/notices_for.py --rows 10000000
+"""
+import os
+import sys
+import time
+import random
+from datetime import timedelta
+
+USERNAME_PREFIX = "notification-bench-"
+NOTICE_TYPE_LABEL = "notification_bench"
+
+# columns copied when doubling the notice table
+NOTICE_COLUMNS = ("recipient_id", "sender_id", "message", "notice_type_id", "added",
+                  "unseen", "archived", "on_site", "related_object_id")
+
+
+def setup():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import django
+    django.setup()
+
+
+def create_users(count):
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(username="%s%s" % (USERNAME_PREFIX, i)) for i in range(count)])
+    return list(User.objects.filter(
+        username__startswith=USERNAME_PREFIX).order_by("pk"))
+
+
+def populate(rows, users, archived=0.0, unseen=0.05, on_site=0.9, heavy_share=0.5, seed_rows=10000):
+    """
+    Creates ``rows`` notices. ``heavy_share`` of them go to the first user,
+    the rest is spread over the others. ``archived``, ``unseen`` and
+    ``on_site`` are the ratios of notices with these flags set.
+
+    ``seed_rows`` notices are created through the ORM, the table is then
+    doubled with INSERT ... SELECT until it holds ``rows`` notices.
+    """
+    from django.db import connection
+    from django.utils import timezone
+    from notification.models import Notice, create_notice_type
+
+    notice_type = create_notice_type(NOTICE_TYPE_LABEL, "Benchmark", "benchmark notices")
+    now = timezone.now()
+    notices = []
+    for i in range(min(rows, seed_rows)):
+        if random.random() < heavy_share:
+            recipient = users[0]
+        else:
+            recipient = random.choice(users[1:])
+        notices.append(Notice(
+            recipient=recipient, message="benchmark notice %s" % i,
+            notice_type=notice_type,
+            added=now - timedelta(minutes=i),
+            unseen=random.random() < unseen,
+            archived=random.random() < archived,
+            on_site=random.random() < on_site))
+    # keep the spread out added dates instead of stamping them all with now
+    added = Notice._meta.get_field("added")
+    added.auto_now_add = False
+    try:
+        Notice.objects.bulk_create(notices, batch_size=1000)
+    finally:
+        added.auto_now_add = True
+    cursor = connection.cursor()
+    table = connection.ops.quote_name(Notice._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(column) for column in NOTICE_COLUMNS)
+    count = len(notices)
+    while count < rows:
+        cursor.execute("INSERT INTO %s (%s) SELECT %s FROM %s WHERE %s = %%s LIMIT %s" % (
+            table, columns, columns, table, connection.ops.quote_name("notice_type_id"),
+            min(count, rows - count)), [notice_type.pk])
+        count += min(count, rows - count)
+        sys.stderr.write("%s notices\n" % count)
+    return notice_type
+
+
+def cleanup(notice_type):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from notification.models import Notice
+    # far too many notices for the ORM's cascading delete
+    connection.cursor().execute("DELETE FROM %s WHERE %s = %%s" % (
+        connection.ops.quote_name(Notice._meta.db_table),
+        connection.ops.quote_name("notice_type_id")), [notice_type.pk])
+    notice_type.delete()
+    get_user_model().objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+def explain(queryset):
+    """
+    Returns the query plan of ``queryset`` as a list of lines.
+    """
+    from django.db import connection
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == "postgresql":
+        prefix = "EXPLAIN ANALYZE "
+    elif connection.vendor == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    cursor = connection.cursor()
+    cursor.execute(prefix + sql, params)
+    return [" ".join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+
+def timeit(func, repeat=5):
+    """
+    Returns the best time of ``repeat`` calls to ``func``, in milliseconds.
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = (time.time() - start) * 1000
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def set_index_together(model, index_together):
+    """
+    Replaces the index_together indexes of ``model`` in the database.
+    """
+    from django.db import connection
+    with connection.schema_editor() as editor:
+        editor.alter_index_together(
+            model, model._meta.index_together, index_together)
+    model._meta.index_together = index_together
+
+
+def report(title, queries, repeat=5):
+    """
+    Prints the plan and best time of every ``(name, queryset, func)`` in
+    ``queries``.
+    """
+    print "=" * 72
+    print title
+    print "=" * 72
+    results = []
+    for name, queryset, func in queries:
+        elapsed = timeit(func, repeat)
+        results.append((name, elapsed))
+        print "--- %s: %.2f ms" % (name, elapsed)
+        for line in explain(queryset):
+            print "    %s" % line
+    return results
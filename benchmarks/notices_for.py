@@ -0,0 +1,62 @@
+"""
+Query plans and latencies of the NoticeManager.notices_for query shapes for a
+heavy user, without and with the composite indexes of Notice.Meta.index_together
+(migration 0006).
+
+    DJANGO_SETTINGS_MODULE=myproject.bench_settings python benchmarks/notices_for.py --rows 10000000
+"""
+from optparse import OptionParser
+
+import common
+
+
+def queries(user):
+    from notification.models import Notice
+    from notification.feeds import ITEMS_PER_FEED
+
+    inbox = Notice.objects.notices_for(user, on_site=True)
+    unseen = Notice.objects.notices_for(user, unseen=True, on_site=True)
+    feed = Notice.objects.notices_for(user).order_by("-added")[:ITEMS_PER_FEED]
+    return [
+        ("inbox, first page", inbox[:15], lambda: list(inbox[:15])),
+        ("inbox, page 100", inbox[1485:1500], lambda: list(inbox[1485:1500])),
+        ("unseen, first page", unseen[:15], lambda: list(unseen[:15])),
+        ("unseen count", unseen, lambda: Notice.objects.unseen_count_for(user, on_site=True)),
+        ("feed items", feed, lambda: list(feed)),
+    ]
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--rows", type="int", default=10000000,
+                      help="number of notices to create")
+    parser.add_option("--users", type="int", default=1000,
+                      help="number of users to spread the notices over")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="number of runs per query, the best one is reported")
+    options, args = parser.parse_args()
+
+    common.setup()
+    from notification.models import Notice
+
+    users = common.create_users(options.users)
+    notice_type = common.populate(options.rows, users, archived=0.8)
+    index_together = Notice._meta.index_together
+    try:
+        common.set_index_together(Notice, [])
+        before = common.report("without composite indexes", queries(users[0]), options.repeat)
+        common.set_index_together(Notice, index_together)
+        after = common.report("with composite indexes", queries(users[0]), options.repeat)
+    finally:
+        if Notice._meta.index_together != index_together:
+            common.set_index_together(Notice, index_together)
+        common.cleanup(notice_type)
+
+    print "=" * 72
+    print "%-24s %12s %12s" % ("query", "before (ms)", "after (ms)")
+    for (name, elapsed_before), (name, elapsed_after) in zip(before, after):
+        print "%-24s %12.2f %12.2f" % (name, elapsed_before, elapsed_after)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 from django.conf import settings
 from django.utils.importlib import import_module
 from django.core.exceptions import ImproperlyConfigured
+from django.test.signals import setting_changed
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+DEFAULT_NOTIFICATION_BACKENDS = ('notification.backends.email.EmailBackend',)
 NOTIFICATION_BACKENDS = getattr(settings, "NOTIFICATION_BACKENDS", 
-                            ('notification.backends.email.EmailBackend',)) 
+                            DEFAULT_NOTIFICATION_BACKENDS) 
+
+# backend registries, keyed by the tuple of backend paths they were built from
+_registries = {}
 
-BACKENDS = []
+# how often the registries were built and explicitly reloaded
+REGISTRY_STATS = {"builds": 0, "reloads": 0}
 
 def load_backend(path):
     i = path.rfind('.')
@@ -35,27 +46,68 @@ def load_backend(path):
     return cls()
 
 
-def get_backends(MY_BACKENDS=NOTIFICATION_BACKENDS):
-    slugs = []
-    BACKENDS = []
-    for backend_path in MY_BACKENDS:
-        backend  = load_backend(backend_path)
+def build_registry(backend_paths):
+    """
+    Loads the backends at ``backend_paths`` and returns them in an ordered
+    dictionary keyed by slug.
+    """
+    registry = OrderedDict()
+    for backend_path in backend_paths:
+        backend = load_backend(backend_path)
 
-        if backend.slug in slugs:
+        if backend.slug in registry:
             raise ImproperlyConfigured("Notification backend `slug` %s is not unique between %s and %s." %  (
                 backend.slug,
-                type(get_backend(backend.slug)),
+                type(registry[backend.slug]),
                 type(backend)))
-        else:
-            slugs.append(backend.slug)
-            BACKENDS.append(backend)
-    return BACKENDS
+        registry[backend.slug] = backend
+    REGISTRY_STATS["builds"] += 1
+    return registry
+
+
+def get_registry(backend_paths=None):
+    """
+    Returns the backend registry for ``backend_paths`` (NOTIFICATION_BACKENDS
+    by default), building it the first time it is requested.
+    """
+    if backend_paths is None:
+        backend_paths = NOTIFICATION_BACKENDS
+    key = tuple(backend_paths)
+    try:
+        return _registries[key]
+    except KeyError:
+        registry = _registries[key] = build_registry(key)
+        return registry
+
+
+def reload_backends():
+    """
+    Drops every loaded backend so that they are imported again (and
+    NOTIFICATION_BACKENDS re-read) on the next lookup. Their background
+    delivery pools are closed as well.
+    """
+    from notification import delivery
+    global NOTIFICATION_BACKENDS
+    NOTIFICATION_BACKENDS = getattr(settings, "NOTIFICATION_BACKENDS",
+                                    DEFAULT_NOTIFICATION_BACKENDS)
+    _registries.clear()
+    delivery.close_pools()
+    REGISTRY_STATS["reloads"] += 1
+
+
+def get_backends(MY_BACKENDS=None):
+    return get_registry(MY_BACKENDS).values()
 
 
 def get_backend(slug):
-    for b in get_backends():
-        if b.slug == slug:
-            return b
-    raise ValueError("Notification backend for slug %s not found. Is NOTIFICATION_BACKENDS correctly defined." % slug)
+    try:
+        return get_registry()[slug]
+    except KeyError:
+        raise ValueError("Notification backend for slug %s not found. Is NOTIFICATION_BACKENDS correctly defined." % slug)
+
 
+def _setting_changed(sender, setting, **kwargs):
+    if setting == "NOTIFICATION_BACKENDS":
+        reload_backends()
 
+setting_changed.connect(_setting_changed)
@@ -26,6 +26,15 @@ class NotificationBackend(object):
         Send the notification.
         """
         raise NotImplemented
+
+    def send_batch(self, messages, *args, **kwargs):
+        """
+        Send several notifications at once. ``messages`` is a list of
+        ``(message, recipients)`` tuples, as they would be passed to ``send``.
+        Backends which can deliver more efficiently in bulk override this.
+        """
+        return [self.send(message, recipients, *args, **kwargs)
+                for message, recipients in messages]
     
     @property
     def sensitivity(self):
@@ -1,10 +1,19 @@
+import re
+import time
+import hashlib
+import logging
+import smtplib
+
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import get_connection, EmailMessage, EmailMultiAlternatives
 from django.utils.translation import ugettext_lazy as _
 
 from notification.backends.base import NotificationBackend
 from HTMLParser import HTMLParser
 
+# how many messages are sent over a single connection before reconnecting
+EMAIL_BATCH_SIZE = getattr(settings, "NOTIFICATION_EMAIL_BATCH_SIZE", 100)
+
 
 class EmailBackend(NotificationBackend):
     """
@@ -24,12 +33,64 @@ class EmailBackend(NotificationBackend):
 
         return addresses
 
-    def send(self, message, recipients, *args, **kwargs):
+    def get_email(self, message, recipients):
+        """
+        Returns the EmailMessage for a rendered message or None if none of the
+        recipients have an email address.
+        """
         subject = ' '.join(message['subject.txt'].splitlines())
         body = message['message.txt']
         addresses = self.get_addresses(recipients)
         if addresses:
-            return send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, addresses)
+            return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, addresses)
+
+    def send(self, message, recipients, *args, **kwargs):
+        email = self.get_email(message, recipients)
+        if email is not None:
+            return email.send()
+
+    def send_batch(self, messages, *args, **kwargs):
+        emails = []
+        for message, recipients in messages:
+            email = self.get_email(message, recipients)
+            if email is not None:
+                emails.append(email)
+        return self.send_emails(emails)
+
+    def send_emails(self, emails):
+        """
+        Sends the emails over as few connections as possible, opening a new
+        one every NOTIFICATION_EMAIL_BATCH_SIZE messages. Returns the number
+        of emails sent.
+        """
+        sent = 0
+        for i in range(0, len(emails), EMAIL_BATCH_SIZE):
+            batch = emails[i:i + EMAIL_BATCH_SIZE]
+            start_time = time.time()
+            batch_sent = self._send_over_connection(batch)
+            logging.info("sent %s of %s emails over one connection in %.2f seconds" % (
+                batch_sent, len(batch), time.time() - start_time))
+            sent += batch_sent
+        return sent
+
+    def _send_over_connection(self, emails):
+        connection = get_connection()
+        connection.open()
+        sent = 0
+        try:
+            for email in emails:
+                try:
+                    sent += connection.send_messages([email]) or 0
+                except smtplib.SMTPServerDisconnected:
+                    # the server dropped the connection, reconnect and retry
+                    # this message once.
+                    logging.warning("SMTP server disconnected, reconnecting")
+                    connection.close()
+                    connection.open()
+                    sent += connection.send_messages([email]) or 0
+        finally:
+            connection.close()
+        return sent
 
 
 class MLStripper(HTMLParser):
@@ -42,6 +103,151 @@ class MLStripper(HTMLParser):
         return ''.join(self.fed)
 
 
+# how many distinct html bodies html_to_text remembers the text of
+HTML_TEXT_CACHE_SIZE = 1000
+
+_html_text_cache = {}
+
+# comments, tags, other markup like doctypes, and text. A "<" which does not
+# start a tag is text.
+_html_tokens = re.compile(
+    r'(<!--.*?-->)|<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>|(<[!?/][^>]*>)|([^<]+|<)', re.S)
+_href = re.compile(r"""href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+_whitespace = re.compile(r'\s+')
+
+_block_tags = frozenset([
+    'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'dl', 'table',
+    'blockquote', 'pre', 'hr', 'address', 'section', 'article', 'header', 'footer'])
+_line_tags = frozenset(['tr', 'dt', 'dd'])
+_skipped_tags = frozenset(['script', 'style', 'head', 'title'])
+
+_skipped_end = dict(
+    (tag, re.compile(r'</%s\s*>' % tag, re.I)) for tag in _skipped_tags)
+
+_unescape = HTMLParser().unescape
+
+
+def html_to_text(html):
+    """
+    Returns the plain text version of an html body, keeping paragraph breaks,
+    list items, preformatted text and the targets of links. The text of the
+    last HTML_TEXT_CACHE_SIZE distinct bodies is remembered.
+    """
+    if isinstance(html, unicode):
+        key = hashlib.sha1(html.encode('utf-8')).hexdigest()
+    else:
+        key = hashlib.sha1(html).hexdigest()
+    try:
+        return _html_text_cache[key]
+    except KeyError:
+        pass
+    text = _HTMLText(html).convert()
+    if len(_html_text_cache) >= HTML_TEXT_CACHE_SIZE:
+        _html_text_cache.clear()
+    _html_text_cache[key] = text
+    return text
+
+
+class _HTMLText(object):
+    """
+    Converts an html body to text with a single pass over its tokens.
+    """
+
+    def __init__(self, html):
+        self.html = html
+        self.parts = []
+        # newlines at the end of the text so far, the start counts as a
+        # paragraph break so leading breaks are dropped
+        self.newlines = 2
+        self.pre = 0
+        self.pre_start = False
+        self.link = None
+
+    def write(self, text):
+        if not text:
+            return
+        self.parts.append(text)
+        if self.link is not None:
+            self.link[1].append(text)
+        stripped = text.rstrip('\n')
+        if stripped:
+            self.newlines = len(text) - len(stripped)
+        else:
+            self.newlines += len(text)
+
+    def line_break(self, count):
+        if self.newlines >= count:
+            return
+        if self.parts and not self.pre:
+            self.parts[-1] = self.parts[-1].rstrip(' ')
+        self.parts.append('\n' * (count - self.newlines))
+        self.newlines = count
+
+    def text(self, token):
+        text = _unescape(token)
+        if self.pre:
+            if self.pre_start and text.startswith('\n'):
+                # like browsers, ignore a newline right after <pre>
+                text = text[1:]
+            self.pre_start = False
+            self.write(text)
+            return
+        text = _whitespace.sub(' ', text)
+        if self.newlines or (self.parts and self.parts[-1].endswith(' ')):
+            text = text.lstrip(' ')
+        self.write(text)
+
+    def tag(self, closing, tag, attrs):
+        if tag in _block_tags:
+            self.line_break(2)
+            if tag == 'pre':
+                self.pre = max(self.pre + (closing and -1 or 1), 0)
+                self.pre_start = not closing
+        elif tag == 'br':
+            self.parts.append('\n')
+            self.newlines += 1
+        elif tag in _line_tags:
+            self.line_break(1)
+        elif tag == 'li':
+            if not closing:
+                self.line_break(1)
+                self.write('* ')
+        elif tag in ('td', 'th'):
+            if not closing and not self.newlines:
+                self.write(' ')
+        elif tag == 'a':
+            if closing:
+                if self.link is not None:
+                    href, text = self.link[0], ''.join(self.link[1]).strip()
+                    self.link = None
+                    if href and href != text and not href.startswith('#'):
+                        self.write(' (%s)' % href)
+            else:
+                href = _href.search(attrs)
+                if href is not None:
+                    href = _unescape([g for g in href.groups() if g is not None][0]).strip()
+                self.link = (href, [])
+
+    def convert(self):
+        html, pos, end = self.html, 0, len(self.html)
+        while pos < end:
+            match = _html_tokens.match(html, pos)
+            pos = match.end()
+            comment, closing, tag, attrs, markup, text = match.groups()
+            if text is not None:
+                self.text(text)
+            elif tag is not None:
+                tag = tag.lower()
+                if tag in _skipped_tags:
+                    if not closing and not attrs.rstrip().endswith('/'):
+                        # skip to the end tag, whatever the content looks like
+                        skipped = _skipped_end[tag].search(html, pos)
+                        pos = skipped and skipped.end() or end
+                else:
+                    self.tag(closing, tag, attrs)
+        return ''.join(self.parts).strip('\n').rstrip()
+
+
 class HTMLEmailBackend(EmailBackend):
     """
     Email delivery backend with html support as alternative content.
@@ -50,19 +256,21 @@ class HTMLEmailBackend(EmailBackend):
     formats = ('subject.txt', 'message.html')
 
     def _strip_tags(self, html):
-        s = MLStripper()
-        s.feed(html)
-        return s.get_data()
+        return html_to_text(html)
 
-    def send(self, messages, recipients, *args, **kwargs):
+    def get_email(self, messages, recipients):
         subject = ' '.join(messages['subject.txt'].splitlines())
         body_html = messages['message.html']
-        body = self._strip_tags(body_html)
         addresses = self.get_addresses(recipients)
         if addresses:
+            body = self._strip_tags(body_html)
             email = EmailMultiAlternatives(
                 subject, body, settings.DEFAULT_FROM_EMAIL, addresses)
             email.attach_alternative(body_html, "text/html")
-            email.send()
             return email
 
+    def send(self, messages, recipients, *args, **kwargs):
+        email = self.get_email(messages, recipients)
+        if email is not None:
+            email.send()
+            return email
@@ -4,7 +4,6 @@ from notification.backends.base import NotificationBackend
 from push_notifications.models import APNSDevice, GCMDevice
 
 import json
-import copy
 
 class MobileBackend(NotificationBackend):
     """
@@ -17,26 +16,58 @@ class MobileBackend(NotificationBackend):
 
     def get_devices(self, recipients):
         devices = []
-        for recipient in recipients:
-            for dev_ios in APNSDevice.objects.filter(user=recipient):
-                devices.append(dev_ios)
-            for dev_android in GCMDevice.objects.filter(user=recipient):
-                devices.append(dev_android)
-
+        user_ids = [recipient.pk for recipient in recipients]
+        devices.extend(APNSDevice.objects.filter(user__in=user_ids))
+        devices.extend(GCMDevice.objects.filter(user__in=user_ids))
         return devices
 
-    def send(self, message, recipients, *args, **kwargs):
-        msg = message['message.txt']
-        devices = self.get_devices(recipients)
+    def get_payloads(self, msg):
+        """
+        Returns the APNS and the GCM payload of a rendered message.
+        """
         json_msg = json.loads(msg)
-        
-        for dev in devices:
-            msg_dev = copy.copy(json_msg)
-            if isinstance(dev, APNSDevice):
-                del msg_dev['msg']
-            else:
-                del msg_dev['aps']
-                
-            dev.send_message(msg_dev)
-        return True
+        apns_payload = dict((key, value) for key, value in json_msg.items() if key != 'msg')
+        gcm_payload = dict((key, value) for key, value in json_msg.items() if key != 'aps')
+        return apns_payload, gcm_payload
+
+    def send(self, message, recipients, *args, **kwargs):
+        return self.send_batch([(message, recipients)], *args, **kwargs)[0]
+
+    def send_batch(self, messages, *args, **kwargs):
+        """
+        Looks up the devices of all recipients with one query per device type
+        and pushes every distinct message to all of its devices with one bulk
+        call per device type.
+        """
+        user_ids = set()
+        for message, recipients in messages:
+            user_ids.update(recipient.pk for recipient in recipients)
+        apns_devices, gcm_devices = {}, {}
+        for device in APNSDevice.objects.filter(user__in=user_ids).only('pk', 'user'):
+            apns_devices.setdefault(device.user_id, []).append(device.pk)
+        for device in GCMDevice.objects.filter(user__in=user_ids).only('pk', 'user'):
+            gcm_devices.setdefault(device.user_id, []).append(device.pk)
+
+        # the devices of every distinct message, in the order they came in
+        by_message = {}
+        distinct = []
+        for message, recipients in messages:
+            msg = message['message.txt']
+            if msg not in by_message:
+                by_message[msg] = (set(), set())
+                distinct.append(msg)
+            apns_pks, gcm_pks = by_message[msg]
+            for recipient in recipients:
+                apns_pks.update(apns_devices.get(recipient.pk, ()))
+                gcm_pks.update(gcm_devices.get(recipient.pk, ()))
 
+        for msg in distinct:
+            apns_pks, gcm_pks = by_message[msg]
+            if not (apns_pks or gcm_pks):
+                continue
+            apns_payload, gcm_payload = self.get_payloads(msg)
+            if apns_pks:
+                APNSDevice.objects.filter(pk__in=apns_pks).send_message(apns_payload)
+            if gcm_pks:
+                GCMDevice.objects.filter(pk__in=gcm_pks).send_message(gcm_payload)
+        return [True] * len(messages)
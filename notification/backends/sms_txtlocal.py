@@ -1,3 +1,5 @@
+import logging
+
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ImproperlyConfigured
@@ -9,6 +11,23 @@ try:
 except ImportError:
     raise ImproperlyConfigured('notifications.backends.txtlocal requires incuna-txtlocal. Try pip install incuna-txtlocal.')
 
+# how many numbers are sent a message with a single request to the gateway
+SMS_BATCH_SIZE = getattr(settings, "NOTIFICATION_SMS_BATCH_SIZE", 10000)
+
+
+class SMSBatchError(Exception):
+    """
+    Raised by ``SMSBackend.send_batch`` after all submissions were made when
+    some of them failed. ``results`` maps every number to the response of its
+    submission, or to the exception it raised.
+    """
+
+    def __init__(self, results, failed):
+        self.results = results
+        self.failed = failed
+        super(SMSBatchError, self).__init__(
+            "sending SMS to %s of %s numbers failed" % (len(failed), len(results)))
+
 class SMSBackend(NotificationBackend):
     """
     SMS delivery backend.
@@ -27,21 +46,67 @@ class SMSBackend(NotificationBackend):
 
         return numbers
 
-    def send(self, message, recipients, *args, **kwargs):
-        subject = ' '.join(message['subject.txt'].splitlines())
-        body = message['message.txt']       
-        if hasattr(settings, 'SMS_GATEWAY_USERNAME') and hasattr(settings, 'SMS_GATEWAY_PASSWORD'):
-            numbers = self.get_numbers(recipients)
-
-            if numbers:
-                sender = getattr(settings, 'SMS_SENDER', None)
-                if settings.DEBUG:
-                    print "SMS To:%s Sender:%s Body:%s" % (numbers, sender, body)
-                if getattr(settings, 'SEND_SMS', False):
-                    return sendSMS(numbers, body, settings.SMS_GATEWAY_USERNAME, settings.SMS_GATEWAY_PASSWORD, sender=sender)
-                else:
-                    print "In order to send SMS notifications add SEND_SMS = True in settings"
-        else:
+    def check_settings(self):
+        if not (hasattr(settings, 'SMS_GATEWAY_USERNAME') and hasattr(settings, 'SMS_GATEWAY_PASSWORD')):
             raise ImproperlyConfigured('SMS_GATEWAY_USERNAME and SMS_GATEWAY_PASSWORD are missing in settings')
 
+    def submit(self, numbers, body):
+        """
+        Sends ``body`` to all ``numbers`` with a single request to the
+        gateway and returns its response. All messages go through here, so
+        this is the one method to replace when testing against a stub.
+        """
+        sender = getattr(settings, 'SMS_SENDER', None)
+        if settings.DEBUG:
+            print "SMS To:%s Sender:%s Body:%s" % (numbers, sender, body)
+        if getattr(settings, 'SEND_SMS', False):
+            return sendSMS(numbers, body, settings.SMS_GATEWAY_USERNAME, settings.SMS_GATEWAY_PASSWORD, sender=sender)
+        else:
+            print "In order to send SMS notifications add SEND_SMS = True in settings"
+
+    def send(self, message, recipients, *args, **kwargs):
+        self.check_settings()
+        numbers = self.get_numbers(recipients)
+        if numbers:
+            return self.submit(numbers, message['message.txt'])
+
+    def send_batch(self, messages, *args, **kwargs):
+        """
+        Sends every distinct message body to all of its numbers at once, in
+        submissions of at most NOTIFICATION_SMS_BATCH_SIZE numbers. Returns a
+        dict mapping each number to the gateway response of the submission it
+        was part of; the response is not broken down per number. If any
+        submission failed, the others are still made and SMSBatchError is
+        raised at the end.
+        """
+        self.check_settings()
+        bodies = []
+        numbers_by_body = {}
+        for message, recipients in messages:
+            body = message['message.txt']
+            if body not in numbers_by_body:
+                numbers_by_body[body] = ([], set())
+                bodies.append(body)
+            numbers, seen = numbers_by_body[body]
+            for number in self.get_numbers(recipients):
+                if number not in seen:
+                    seen.add(number)
+                    numbers.append(number)
 
+        results = {}
+        failed = []
+        for body in bodies:
+            numbers = numbers_by_body[body][0]
+            for i in range(0, len(numbers), SMS_BATCH_SIZE):
+                batch = numbers[i:i + SMS_BATCH_SIZE]
+                try:
+                    result = self.submit(batch, body)
+                except Exception, e:
+                    logging.exception("sending SMS to %s numbers failed" % len(batch))
+                    result = e
+                    failed.extend(batch)
+                for number in batch:
+                    results[number] = result
+        if failed:
+            raise SMSBatchError(results, failed)
+        return results
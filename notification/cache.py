@@ -0,0 +1,163 @@
+"""
+Per-user data kept in the cache (NOTIFICATION_CACHE, "default" by default).
+
+The number of unseen, unarchived on-site notices of a user is displayed on every page, so
+it is counted once and then kept up to date by the code marking notices sent,
+seen, archived or deleted. Should it drift anyway, the
+``reconcile_unseen_counts`` management command recounts it for every user.
+
+The NoticeSettings of a user are checked for every notice sent to them, so
+they are cached as a small matrix: for every notice type, a bitset of the
+media which have a setting and one of the media which have ``send`` on. It is
+invalidated whenever a setting of the user is saved, deleted or created in
+bulk.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import Count
+
+CACHE_ALIAS = getattr(settings, "NOTIFICATION_CACHE", "default")
+
+UNSEEN_COUNT_TIMEOUT = getattr(settings, "NOTIFICATION_UNSEEN_COUNT_TIMEOUT", 60 * 60 * 24)
+
+SETTINGS_TIMEOUT = getattr(settings, "NOTIFICATION_SETTINGS_TIMEOUT", 60 * 60 * 24)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def unseen_count_key(user_id):
+    # v2 counts exclude archived notices
+    return "notification:unseen_count:v2:%s" % user_id
+
+
+def unseen_count_filter():
+    """
+    Lookups matching the notices counted as unseen.
+    """
+    return {"unseen": True, "on_site": True, "archived": False}
+
+
+def counts_as_unseen(notice):
+    return notice.unseen and notice.on_site and not notice.archived
+
+
+def get_unseen_count(user):
+    """
+    Returns the number of unseen, unarchived on-site notices of ``user``.
+    """
+    from notification.models import Notice
+    cache = get_cache()
+    key = unseen_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notice.objects.unseen_count_for(user, on_site=True)
+        cache.set(key, count, UNSEEN_COUNT_TIMEOUT)
+    return count
+
+
+def change_unseen_count(user_id, delta):
+    """
+    Adds ``delta`` to the cached unseen count of a user. Counts which are not
+    cached are left alone, they are counted on the next read.
+    """
+    if not delta:
+        return
+    cache = get_cache()
+    key = unseen_count_key(user_id)
+    try:
+        count = cache.incr(key, delta)
+    except ValueError:
+        return
+    if count < 0:
+        cache.delete(key)
+
+
+def set_unseen_count(user_id, count):
+    get_cache().set(unseen_count_key(user_id), count, UNSEEN_COUNT_TIMEOUT)
+
+
+def update_unseen_count(notice, was_unseen):
+    """
+    Updates the unseen count of the recipient of ``notice`` after it changed.
+    ``was_unseen`` is what counts_as_unseen returned before the change.
+    """
+    is_unseen = counts_as_unseen(notice)
+    if was_unseen != is_unseen:
+        change_unseen_count(notice.recipient_id, is_unseen and 1 or -1)
+
+
+def reconcile_unseen_counts(chunk_size=1000):
+    """
+    Recounts the unseen notices of every user and stores the result in the
+    cache. Returns the number of users updated.
+    """
+    from notification.models import Notice, chunked
+    counts = dict(Notice.objects.filter(**unseen_count_filter()).values_list(
+        "recipient").annotate(Count("id")).order_by())
+    cache = get_cache()
+    updated = 0
+    all_user_ids = get_user_model()._default_manager.values_list("pk", flat=True)
+    for user_ids in chunked(all_user_ids.iterator(), chunk_size):
+        cache.set_many(dict(
+            (unseen_count_key(user_id), counts.get(user_id, 0)) for user_id in user_ids),
+            UNSEEN_COUNT_TIMEOUT)
+        updated += len(user_ids)
+    return updated
+
+
+def settings_key(user_id):
+    return "notification:settings:%s" % user_id
+
+
+def get_settings_matrix(user_id):
+    """
+    Returns the notice settings of a user as a ``(media, bits)`` tuple.
+    ``media`` is the sorted tuple of media the user has settings for and
+    ``bits`` maps notice type ids to ``(known, send)`` bitsets, in which bit
+    ``i`` stands for ``media[i]``.
+    """
+    from notification.models import NoticeSetting
+    cache = get_cache()
+    key = settings_key(user_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        rows = list(NoticeSetting.objects.filter(user=user_id).values_list(
+            "notice_type", "medium", "send"))
+        media = tuple(sorted(set(medium for notice_type_id, medium, send in rows)))
+        bits = {}
+        for notice_type_id, medium, send in rows:
+            bit = 1 << media.index(medium)
+            known, sends = bits.get(notice_type_id, (0, 0))
+            if send:
+                sends |= bit
+            bits[notice_type_id] = (known | bit, sends)
+        matrix = (media, bits)
+        cache.set(key, matrix, SETTINGS_TIMEOUT)
+    return matrix
+
+
+def cached_should_send(user_id, notice_type_id, medium):
+    """
+    Returns the ``send`` flag of a user's setting from the cached matrix, or
+    None if the user has no such setting yet.
+    """
+    media, bits = get_settings_matrix(user_id)
+    try:
+        bit = 1 << media.index(medium)
+    except ValueError:
+        return None
+    known, sends = bits.get(notice_type_id, (0, 0))
+    if not known & bit:
+        return None
+    return bool(sends & bit)
+
+
+def invalidate_settings(user_ids):
+    get_cache().delete_many([settings_key(user_id) for user_id in user_ids])
+
+
+def notice_setting_changed(sender, instance, **kwargs):
+    invalidate_settings([instance.user_id])
@@ -1,10 +1,83 @@
-from notification.models import Notice
+from notification.cache import get_unseen_count
+
+
+class LazyUnseenCount(object):
+    """
+    The unseen notice count of a user, looked up the first time a template
+    actually uses it.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = get_unseen_count(self.user)
+        return self._count
+
+    def __int__(self):
+        return int(self.count)
+
+    def __float__(self):
+        return float(self.count)
+
+    def __index__(self):
+        return self.count
+
+    def __nonzero__(self):
+        return bool(self.count)
+    __bool__ = __nonzero__
+
+    def __str__(self):
+        return str(self.count)
+
+    def __unicode__(self):
+        return unicode(self.count)
+
+    def __repr__(self):
+        return "<LazyUnseenCount: %s>" % self.user
+
+    def __eq__(self, other):
+        return self.count == other
+
+    def __ne__(self, other):
+        return self.count != other
+
+    def __lt__(self, other):
+        return self.count < other
+
+    def __le__(self, other):
+        return self.count <= other
+
+    def __gt__(self, other):
+        return self.count > other
+
+    def __ge__(self, other):
+        return self.count >= other
+
+    def __hash__(self):
+        return hash(self.count)
+
+    def __add__(self, other):
+        return self.count + other
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.count - other
+
+    def __rsub__(self, other):
+        return other - self.count
+
 
 def notification(request):
     if request.user.is_authenticated():
+        # shared by every RequestContext of this request
+        if not hasattr(request, '_notice_unseen_count'):
+            request._notice_unseen_count = LazyUnseenCount(request.user)
         return {
-            'notice_unseen_count': Notice.objects.unseen_count_for(
-                request.user, on_site=True),
+            'notice_unseen_count': request._notice_unseen_count,
         }
     else:
         return {}
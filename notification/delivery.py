@@ -0,0 +1,175 @@
+"""
+Background delivery of rendered notices.
+
+Every backend gets its own pool of worker threads fed through a bounded
+queue, so a slow backend only holds up its own deliveries. Submitted messages
+are split into jobs of at most NOTIFICATION_DELIVERY_JOB_SIZE messages, which
+the threads of a backend deliver in parallel. When a queue is full,
+submitting blocks until a worker frees a slot, which keeps the memory used by
+pending deliveries bounded.
+
+Failed deliveries are logged and recorded, ``flush`` raises a DeliveryError
+for them so callers waiting for their deliveries find out.
+"""
+import atexit
+import logging
+import threading
+from Queue import Queue
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# number of delivery threads per backend slug, "default" for the others
+DELIVERY_CONCURRENCY = getattr(settings, "NOTIFICATION_DELIVERY_CONCURRENCY", {})
+
+# number of pending jobs per backend before submitting blocks
+DELIVERY_QUEUE_SIZE = getattr(settings, "NOTIFICATION_DELIVERY_QUEUE_SIZE", 100)
+
+# maximum number of messages delivered by a single job
+DELIVERY_JOB_SIZE = getattr(settings, "NOTIFICATION_DELIVERY_JOB_SIZE", 100)
+
+# number of failures kept per backend until the next flush
+MAX_RECORDED_FAILURES = 10
+
+# pools keyed by backend instance
+_pools = {}
+_pools_lock = threading.Lock()
+
+# pools of reloaded backends, still finishing the deliveries submitted to them
+_retired = []
+
+
+class DeliveryError(Exception):
+    """
+    Raised by ``flush`` when background deliveries failed since the last
+    flush. ``failures`` is a list of ``(backend slug, number of messages,
+    exception)`` tuples.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        failed = sum(count for slug, count, e in failures)
+        super(DeliveryError, self).__init__("%s notifications could not be delivered: %s" % (
+            failed, "; ".join("%s: %r" % (slug, e) for slug, count, e in failures)))
+
+
+class DeliveryPool(object):
+    """
+    Threads delivering the notices of a single backend.
+    """
+
+    def __init__(self, backend, workers=2, queue_size=100):
+        self.backend = backend
+        self.jobs = Queue(queue_size)
+        self.failures = []
+        self.failures_lock = threading.Lock()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self.work, name="notification-%s-%s" % (backend.slug, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, messages):
+        self.jobs.put(messages)
+
+    def work(self):
+        from notification.models import deliver_notifications
+        while True:
+            messages = self.jobs.get()
+            if messages is None:
+                # the pool was closed
+                self.jobs.task_done()
+                return
+            try:
+                deliver_notifications(self.backend, messages)
+            except Exception, e:
+                logging.exception("delivering %s notifications through %s failed" % (
+                    len(messages), self.backend.slug))
+                with self.failures_lock:
+                    if len(self.failures) < MAX_RECORDED_FAILURES:
+                        self.failures.append((self.backend.slug, len(messages), e))
+                    else:
+                        slug, count, first = self.failures[-1]
+                        self.failures[-1] = (slug, count + len(messages), first)
+            finally:
+                self.jobs.task_done()
+                close_old_connections()
+
+    def join(self):
+        """
+        Waits until every submitted delivery has been made and returns the
+        failures recorded since the last join.
+        """
+        self.jobs.join()
+        with self.failures_lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def close(self):
+        """
+        Stops the threads once they have made the deliveries submitted so far.
+        """
+        for thread in self.threads:
+            self.jobs.put(None)
+
+
+def get_pool(backend):
+    try:
+        return _pools[backend]
+    except KeyError:
+        with _pools_lock:
+            if backend not in _pools:
+                workers = DELIVERY_CONCURRENCY.get(
+                    backend.slug, DELIVERY_CONCURRENCY.get("default", 2))
+                _pools[backend] = DeliveryPool(
+                    backend, workers, DELIVERY_QUEUE_SIZE)
+            return _pools[backend]
+
+
+def close_pools():
+    """
+    Closes the pools of all backends, called when the backends are reloaded.
+    Deliveries already submitted are still made, and reported by ``flush``.
+    """
+    with _pools_lock:
+        pools = _pools.values()
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+    _retired.extend(pools)
+
+
+def submit(backend, messages):
+    """
+    Queues a list of ``(message, recipients)`` tuples for delivery through
+    ``backend`` and returns without waiting for it.
+    """
+    pool = get_pool(backend)
+    for i in range(0, len(messages), DELIVERY_JOB_SIZE):
+        pool.submit(messages[i:i + DELIVERY_JOB_SIZE])
+
+
+def flush():
+    """
+    Waits until every delivery submitted so far has been made. Raises a
+    DeliveryError if any of them failed.
+    """
+    failures = []
+    for pool in _pools.values():
+        failures.extend(pool.join())
+    while _retired:
+        failures.extend(_retired.pop().join())
+    if failures:
+        raise DeliveryError(failures)
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except DeliveryError:
+        # already logged by the delivery threads
+        pass
+
+atexit.register(_flush_at_exit)
@@ -1,28 +1,193 @@
-
+import os
 import sys
 import time
+import socket
 import logging
 import traceback
-
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+from datetime import timedelta
 
 from django.conf import settings
 from django.core.mail import mail_admins
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.db.models import Q
+from django.utils import timezone
 
 from lockfile import FileLock, AlreadyLocked, LockTimeout
 
 from notification.models import NoticeQueueBatch
 from notification import models as notification
+from notification import delivery
 
 # lock timeout value. how long to wait for the lock to become available.
 # default behavior is to never wait for the lock to be available.
 LOCK_WAIT_TIMEOUT = getattr(settings, "NOTIFICATION_LOCK_WAIT_TIMEOUT", -1)
 
+# how long (in seconds) a worker may hold a batch without renewing its lease
+# before other workers consider it crashed and take the batch over.
+LEASE_TIMEOUT = getattr(settings, "NOTIFICATION_LEASE_TIMEOUT", 10 * 60)
+
+# how many queued recipients are loaded and sent to at once
+CHUNK_SIZE = getattr(settings, "NOTIFICATION_QUEUE_CHUNK_SIZE", notification.BULK_CHUNK_SIZE)
+
+
+class LeaseLost(Exception):
+    """
+    Raised when another worker took over a batch whose lease expired.
+    """
+    pass
+
+
+def get_worker_id():
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+def claimable_batches(now):
+    expired = now - timedelta(seconds=LEASE_TIMEOUT)
+    return NoticeQueueBatch.objects.filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=expired))
+
+
+def claim_batch(worker_id):
+    """
+    Atomically claims the oldest batch that is not leased by another worker
+    and returns it, or None if there is nothing left to claim.
+    """
+    now = timezone.now()
+    while True:
+        candidates = list(claimable_batches(now).order_by("pk").values_list(
+            "pk", flat=True)[:10])
+        if not candidates:
+            return None
+        for pk in candidates:
+            # only one worker can win this conditional update
+            if claimable_batches(now).filter(pk=pk).update(
+                    claimed_by=worker_id, claimed_at=now):
+                return NoticeQueueBatch.objects.get(pk=pk)
+
+
+def renew_lease(queued_batch, worker_id, progress=None):
+    """
+    Extends the lease on a claimed batch, recording how many of its
+    recipients have been sent to if ``progress`` is given. Raises LeaseLost
+    if the batch has been taken over by another worker in the meantime.
+    """
+    updates = {"claimed_at": timezone.now()}
+    if progress is not None:
+        updates["progress"] = progress
+    renewed = NoticeQueueBatch.objects.filter(
+        pk=queued_batch.pk, claimed_by=worker_id).update(**updates)
+    if not renewed:
+        raise LeaseLost("lost the lease on batch %s" % queued_batch.pk)
+    if progress is not None:
+        queued_batch.progress = progress
+
+
+def release_batch(queued_batch, worker_id):
+    """
+    Gives up the lease on a batch so that another worker can retry it.
+    """
+    NoticeQueueBatch.objects.filter(
+        pk=queued_batch.pk, claimed_by=worker_id).update(claimed_by="", claimed_at=None)
+
+
+def get_sender(payload):
+    """
+    Returns the sender of a queued notice. Batches queued by older versions
+    hold the sender itself, newer ones only its id.
+    """
+    sender = payload.sender
+    if sender is None or hasattr(sender, "pk"):
+        return sender
+    try:
+        return User.objects.get(pk=sender)
+    except User.DoesNotExist:
+        return None
+
+
+def send_batch(queued_batch, worker_id):
+    """
+    Sends every notice of a claimed batch and returns how many were sent.
+
+    Progress is saved after every chunk of recipients, so a batch that was
+    interrupted resumes after the last completed chunk instead of sending the
+    whole batch again.
+    """
+    sent = 0
+    position = 0
+    resume_from = queued_batch.progress
+    if resume_from:
+        logging.info("resuming batch %s after %s recipients" % (
+            queued_batch.pk, resume_from))
+    for payload in queued_batch.get_payloads():
+        start = max(resume_from - position, 0)
+        position += len(payload)
+        if start >= len(payload):
+            continue
+        label = payload.label
+        sender = get_sender(payload)
+        for user_ids in payload.iter_recipient_ids(start, chunk_size=CHUNK_SIZE):
+            chunk_start = time.time()
+            found = User.objects.in_bulk(user_ids)
+            users = []
+            for user_id in user_ids:
+                if user_id in found:
+                    users.append(found[user_id])
+                else:
+                    # Ignore deleted users, just warn about them
+                    logging.warning("not emitting notice %s to user %s since it does not exist" % (label, user_id))
+            if users:
+                notification.send_now(
+                    users, label, payload.extra_context, payload.on_site, sender,
+                    payload.related_object_id, groups=False, bulk=True,
+                    recipient_context=payload.recipient_context)
+                # don't record progress before the chunk has been delivered
+                delivery.flush()
+            logging.info("emitted notice %s to %s users in %.2f seconds" % (
+                label, len(users), time.time() - chunk_start))
+            sent += len(user_ids)
+            renew_lease(queued_batch, worker_id, queued_batch.progress + len(user_ids))
+    return sent
+
+
+def send_batches(worker_id):
+    """
+    Claims and sends batches until the queue is empty.
+    """
+    batches, sent = 0, 0
+    start_time = time.time()
+
+    try:
+        while True:
+            queued_batch = claim_batch(worker_id)
+            if queued_batch is None:
+                break
+            try:
+                sent += send_batch(queued_batch, worker_id)
+            except LeaseLost, e:
+                logging.warning("%s, skipping it" % e)
+                continue
+            except:
+                release_batch(queued_batch, worker_id)
+                raise
+            queued_batch.delete()
+            batches += 1
+    except:
+        # get the exception
+        exc_class, e, t = sys.exc_info()
+        # email people
+        current_site = Site.objects.get_current()
+        subject = "[%s emit_notices] %r" % (current_site.name, e)
+        message = "%s" % ("\n".join(traceback.format_exception(*sys.exc_info())),)
+        mail_admins(subject, message, fail_silently=True)
+        # log it as critical
+        logging.critical("an exception occurred: %r" % e)
+
+    logging.info("")
+    logging.info("%s batches, %s sent" % (batches, sent,))
+    logging.info("done in %.2f seconds" % (time.time() - start_time))
+
+
 def send_all():
     lock = FileLock("send_notices")
 
@@ -37,42 +202,21 @@ def send_all():
         return
     logging.debug("acquired.")
 
-    batches, sent = 0, 0
-    start_time = time.time()
-
     try:
-        # nesting the try statement to be Python 2.4
-        try:
-            for queued_batch in NoticeQueueBatch.objects.all():
-                notices = pickle.loads(str(queued_batch.pickled_data).decode("base64"))
-                for user, label, extra_context, on_site, sender in notices:
-                    try:
-                        user = User.objects.get(pk=user)
-                        logging.info("emitting notice %s to %s" % (label, user))
-                        # call this once per user to be atomic and allow for logging to
-                        # accurately show how long each takes.
-                        notification.send_now([user], label, extra_context, on_site, sender, groups=False)
-                    except User.DoesNotExist:
-                        # Ignore deleted users, just warn about them
-                        logging.warning("not emitting notice %s to user %s since it does not exist" % (label, user))
-                    sent += 1
-                queued_batch.delete()
-                batches += 1
-        except:
-            # get the exception
-            exc_class, e, t = sys.exc_info()
-            # email people
-            current_site = Site.objects.get_current()
-            subject = "[%s emit_notices] %r" % (current_site.name, e)
-            message = "%s" % ("\n".join(traceback.format_exception(*sys.exc_info())),)
-            mail_admins(subject, message, fail_silently=True)
-            # log it as critical
-            logging.critical("an exception occurred: %r" % e)
+        send_batches(get_worker_id())
     finally:
         logging.debug("releasing lock...")
         lock.release()
         logging.debug("released.")
-    
-    logging.info("")
-    logging.info("%s batches, %s sent" % (batches, sent,))
-    logging.info("done in %.2f seconds" % (time.time() - start_time))
+
+
+def run_worker(worker_id=None):
+    """
+    Sends queued batches without taking the global lock. Any number of workers
+    can run at the same time, on one or several hosts; each batch is leased
+    to a single worker in the database.
+    """
+    if worker_id is None:
+        worker_id = get_worker_id()
+    logging.info("worker %s starting" % worker_id)
+    send_batches(worker_id)
@@ -1,15 +1,25 @@
 
 import logging
+from optparse import make_option
 
 from django.core.management.base import NoArgsCommand
 
-from notification.engine import send_all
+from notification.engine import send_all, run_worker
 
 class Command(NoArgsCommand):
     help = "Emit queued notices."
-    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--worker', action='store_true', dest='worker', default=False,
+            help='Run as one of several concurrent workers instead of taking the global lock.'),
+        make_option('--worker-id', dest='worker_id', default=None,
+            help='Name used for the batch leases of this worker. Defaults to hostname:pid.'),
+    )
+
     def handle_noargs(self, **options):
         logging.basicConfig(level=logging.DEBUG, format="%(message)s")
         logging.info("-" * 72)
-        send_all()
-    
\ No newline at end of file
+        if options.get('worker'):
+            run_worker(options.get('worker_id'))
+        else:
+            send_all()
+
@@ -0,0 +1,11 @@
+
+from django.core.management.base import NoArgsCommand
+
+from notification.cache import reconcile_unseen_counts
+
+class Command(NoArgsCommand):
+    help = "Recount the cached number of unseen notices of every user."
+
+    def handle_noargs(self, **options):
+        updated = reconcile_unseen_counts()
+        self.stdout.write("Reconciled the unseen notice count of %s users." % updated)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0003_noticequeuebatch_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='noticequeuebatch',
+            name='payload',
+            field=models.BinaryField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='noticequeuebatch',
+            name='pickled_data',
+            field=models.TextField(editable=False, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0005_noticequeuebatch_progress'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='notice',
+            index_together=set([('recipient', 'archived', 'on_site', 'added'), ('recipient', 'unseen', 'on_site')]),
+        ),
+    ]
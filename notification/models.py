@@ -1,19 +1,15 @@
 import importlib
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
-
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.template import Context
-from django.template.loader import render_to_string
+from django.template import Context, Variable, VariableDoesNotExist
 
 from django.core.exceptions import ImproperlyConfigured
 
+from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
@@ -22,6 +18,11 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext, get_language, activate
 
 from notification.backends import get_backends, get_backend
+from notification.rendering import get_notice_template, get_context_processors, run_context_processors
+from notification.payload import QueuePayload, decode_pickled
+from notification import delivery
+from notification.cache import counts_as_unseen, change_unseen_count, update_unseen_count
+from notification.cache import cached_should_send, invalidate_settings, notice_setting_changed
 
 from django.contrib.auth.models import Group as AuthGroup
 
@@ -30,12 +31,17 @@ from django.contrib.auth.models import Group as AuthGroup
     or notification/
 """
 
-CONTEXT_PROCESSORS = getattr(
-    settings, "NOTIFICATION_CONTEXT_PROCESSORS", None)
-
 QUEUE_ALL = getattr(settings, "NOTIFICATION_QUEUE_ALL", False)
+BULK_SEND = getattr(settings, "NOTIFICATION_BULK_SEND", False)
+BULK_CHUNK_SIZE = getattr(settings, "NOTIFICATION_BULK_CHUNK_SIZE", 500)
+ASYNC_DELIVERY = getattr(settings, "NOTIFICATION_ASYNC_DELIVERY", False)
 USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
+# context keys which differ between the recipients of a notice type, by label.
+# Types listed here are rendered once per language and distinct values of
+# these keys instead of once per recipient.
+RECIPIENT_CONTEXT = getattr(settings, "NOTIFICATION_RECIPIENT_CONTEXT", {})
+
 
 class LanguageStoreNotAvailable(Exception):
     pass
@@ -70,6 +76,14 @@ class NoticeType(models.Model):
     def template_slug(self):
         return self.slug or self.label
 
+    @property
+    def recipient_context(self):
+        """
+        Context keys that differ between recipients, or None if the whole
+        context is considered recipient specific.
+        """
+        return RECIPIENT_CONTEXT.get(self.label)
+
 
 class NoticeMediaListChoices():
     """
@@ -112,6 +126,9 @@ class NoticeSetting(models.Model):
     def __unicode__(self):
         return self.medium
 
+models.signals.post_save.connect(notice_setting_changed, sender=NoticeSetting)
+models.signals.post_delete.connect(notice_setting_changed, sender=NoticeSetting)
+
 
 def create_notification_setting(user, notice_type, medium):
     default = (get_backend(medium).sensitivity <= notice_type.default)
@@ -144,8 +161,63 @@ def get_notification_settings(user, notification_label):
             user=user, notice_type__label=notification_label)
     return result
 
+def get_notification_settings_for(users, notice_types, media, initial=None):
+    """
+        Gets NoticeSettings for every user, notice type and medium given with a
+        single query and returns them in a dictionary keyed by
+        ``(user_id, notice_type_id, medium)``.
+        Missing settings are created with their defaults using ``bulk_create``,
+        or with the ``send`` value found under their key in ``initial``.
+    """
+    user_ids = []
+    seen = set()
+    for user in users:
+        if user.pk not in seen:
+            seen.add(user.pk)
+            user_ids.append(user.pk)
+    notice_types = list(notice_types)
+    result = {}
+    if not user_ids or not notice_types or not media:
+        return result
+    queryset = NoticeSetting.objects.filter(
+        user__in=user_ids, notice_type__in=notice_types, medium__in=media)
+    for setting in queryset:
+        result[(setting.user_id, setting.notice_type_id, setting.medium)] = setting
+    missing = []
+    for notice_type in notice_types:
+        for medium in media:
+            default = (get_backend(medium).sensitivity <= notice_type.default)
+            for user_id in user_ids:
+                key = (user_id, notice_type.pk, medium)
+                if key not in result:
+                    send = default
+                    if initial is not None:
+                        send = initial.get(key, default)
+                    setting = NoticeSetting(
+                        user_id=user_id, notice_type=notice_type, medium=medium, send=send)
+                    result[key] = setting
+                    missing.append(setting)
+    if missing:
+        try:
+            with transaction.atomic():
+                NoticeSetting.objects.bulk_create(missing, batch_size=BULK_CHUNK_SIZE)
+        except IntegrityError:
+            # another process created some of the settings in the meantime,
+            # fall back to creating the remaining ones one by one.
+            for setting in missing:
+                key = (setting.user_id, setting.notice_type_id, setting.medium)
+                result[key], created = NoticeSetting.objects.get_or_create(
+                    user_id=setting.user_id, notice_type=setting.notice_type,
+                    medium=setting.medium, defaults={"send": setting.send})
+        # bulk_create doesn't send post_save
+        invalidate_settings(set(setting.user_id for setting in missing))
+    return result
+
 def should_send(user, notice_type, medium):
-    return get_notification_setting(user, notice_type, medium).send
+    send = cached_should_send(user.pk, notice_type.pk, medium)
+    if send is None:
+        send = get_notification_setting(user, notice_type, medium).send
+    return send
 
 
 class NoticeManager(models.Manager):
@@ -167,7 +239,7 @@ class NoticeManager(models.Manager):
             lookup_kwargs = {"recipient": user}
         qs = self.filter(**lookup_kwargs)
         if not archived:
-            self.filter(archived=archived)
+            qs = qs.filter(archived=False)
         if unseen is not None:
             qs = qs.filter(unseen=unseen)
         if on_site is not None:
@@ -212,8 +284,10 @@ class Notice(models.Model):
         return self.message
 
     def archive(self):
+        was_unseen = counts_as_unseen(self)
         self.archived = True
         self.save()
+        update_unseen_count(self, was_unseen)
 
     def is_unseen(self):
         """
@@ -224,14 +298,21 @@ class Notice(models.Model):
         """
         unseen = self.unseen
         if unseen:
+            was_unseen = counts_as_unseen(self)
             self.unseen = False
             self.save()
+            update_unseen_count(self, was_unseen)
         return unseen
 
     class Meta:
         ordering = ["-added"]
         verbose_name = _("notice")
         verbose_name_plural = _("notices")
+        # match the lookups of NoticeManager.notices_for and unseen_count_for
+        index_together = [
+            ("recipient", "archived", "on_site", "added"),
+            ("recipient", "unseen", "on_site"),
+        ]
 
     def get_absolute_url(self):
         return reverse("notification_notice", args=[str(self.pk)])
@@ -245,8 +326,27 @@ class NoticeQueueBatch(models.Model):
     """
     A queued notice.
     Denormalized data for a notice.
+
+    The notices are stored in payload (see notification.payload), batches
+    queued by older versions in pickled_data.
+
+    claimed_by and claimed_at hold the lease of the emit_notices worker
+    currently sending the batch, progress how many of its recipients have
+    already been sent to.
     """
-    pickled_data = models.TextField()
+    pickled_data = models.TextField(blank=True, editable=False)
+    payload = models.BinaryField(null=True)
+    claimed_by = models.CharField(max_length=255, blank=True, editable=False)
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    progress = models.PositiveIntegerField(default=0, editable=False)
+
+    def get_payloads(self):
+        """
+        Returns the list of QueuePayloads queued in this batch.
+        """
+        if self.payload is not None:
+            return [QueuePayload.decode(self.payload)]
+        return decode_pickled(self.pickled_data)
 
 class Group(AuthGroup):
     """
@@ -289,23 +389,78 @@ def create_notice_type(label, display, description, default=2, verbosity=1, slug
             print "Created %s NoticeType" % label
     return notice_type
 
+_language_model = {}
+
+def get_language_model():
+    """
+    Returns the model of the NOTIFICATION_LANGUAGE_MODULE setting, looking it
+    up only once. Raises LanguageStoreNotAvailable if this site does not use
+    translated notifications.
+    """
+    language_module = getattr(settings, 'NOTIFICATION_LANGUAGE_MODULE', False)
+    if not language_module:
+        raise LanguageStoreNotAvailable
+    if language_module not in _language_model:
+        try:
+            app_label, model_name = language_module.split('.')
+            model = models.get_model(app_label, model_name)
+        except (ImportError, ImproperlyConfigured, ValueError):
+            model = None
+        _language_model[language_module] = model
+    model = _language_model[language_module]
+    if model is None:
+        raise LanguageStoreNotAvailable
+    return model
+
 def get_notification_language(user):
     """
     Returns site-specific notification language for this user. Raises
     LanguageStoreNotAvailable if this site does not use translated
     notifications.
     """
-    if getattr(settings, 'NOTIFICATION_LANGUAGE_MODULE', False):
-        try:
-            app_label, model_name = settings.NOTIFICATION_LANGUAGE_MODULE.split('.')
-            model = models.get_model(app_label, model_name)
-            language_model = model._default_manager.get(user__id__exact=user.id)
-            if hasattr(language_model, 'language'):
-                return language_model.language
-        except (ImportError, ImproperlyConfigured, model.DoesNotExist):
-            raise LanguageStoreNotAvailable
+    model = get_language_model()
+    try:
+        language_model = model._default_manager.get(user__id__exact=user.id)
+    except model.DoesNotExist:
+        raise LanguageStoreNotAvailable
+    if hasattr(language_model, 'language'):
+        return language_model.language
     raise LanguageStoreNotAvailable
 
+def get_notification_languages(users):
+    """
+    Returns a dict mapping the ids of ``users`` to their notification
+    language, looked up with a single query. Users without a language are
+    left out.
+    """
+    try:
+        model = get_language_model()
+    except LanguageStoreNotAvailable:
+        return {}
+    languages = {}
+    for language_model in model._default_manager.filter(user__in=[user.pk for user in users]):
+        language = getattr(language_model, 'language', None)
+        if language is not None:
+            languages[language_model.user_id] = language
+    return languages
+
+def group_by_language(users):
+    """
+    Returns a list of ``(language, users)`` tuples grouping ``users`` by
+    notification language, so each language only has to be activated once.
+    The language is None for users without one.
+    """
+    languages = get_notification_languages(users)
+    groups = []
+    by_language = {}
+    for user in users:
+        language = languages.get(user.pk)
+        if language not in by_language:
+            by_language[language] = []
+            groups.append((language, by_language[language]))
+        by_language[language].append(user)
+    return groups
+
 def from_string_import(string):
     """
     Returns the attribute from a module, specified by a string.
@@ -314,32 +469,192 @@ def from_string_import(string):
     return getattr(importlib.import_module(module), attrib)
 
 
-def get_formatted_message(formats, notice_type, context, media_slug=None):
+def get_formatted_message(formats, notice_type, context, media_slug=None, context_processors=True):
     """
     Returns a dictionary with the format identifier as the key. The values are
     are fully rendered templates with the given context.
+
+    The NOTIFICATION_CONTEXT_PROCESSORS are applied to the context first,
+    unless ``context_processors`` is False because the caller already did.
     """
     format_templates = {}
     if context is None:
         context = {}
-    if CONTEXT_PROCESSORS:
-        for c_p in [from_string_import(x) for x in CONTEXT_PROCESSORS]:
-            context.update(c_p())
+    if context_processors:
+        per_send, per_recipient = get_context_processors()
+        if per_send or per_recipient:
+            context.update(run_context_processors(per_send + per_recipient))
     for format in formats:
         # conditionally turn off autoescaping for .txt extensions in format
         if format.endswith(".txt") or format.endswith(".html"):
             context.autoescape = False
         else:
             context.autoescape = True
-        format_templates[format] = render_to_string((
-            'notification/%s/%s/%s' % (
-                    notice_type.template_slug, media_slug, format),
-            'notification/%s/%s' % (notice_type.template_slug, format),
-            'notification/%s/%s' % (media_slug, format),
-            'notification/%s' % format), context_instance=context)
+        template = get_notice_template(
+            notice_type.template_slug, media_slug, format)
+        context.push()
+        try:
+            format_templates[format] = template.render(context)
+        finally:
+            context.pop()
     return format_templates
 
-def send_now(users, label, extra_context=None, on_site=None, sender=None, related_object_id=None, groups=True, backends=get_backends()):
+class NoticeRenderer(object):
+    """
+    Renders the messages of a single send.
+
+    If ``recipient_context`` is given, it lists the (possibly dotted) context
+    keys that differ between recipients, e.g. ``("recipient.first_name",)``,
+    and messages are rendered only once for every language and distinct value
+    of those keys.
+
+    The output of the ``per_send`` context processors is computed once for
+    the whole send, the other processors run once per recipient through
+    ``update_context``.
+    """
+    max_shared_messages = 1000
+
+    def __init__(self, notice_type, recipient_context=None):
+        self.notice_type = notice_type
+        if recipient_context is not None:
+            recipient_context = [Variable(key) for key in recipient_context]
+        self.recipient_context = recipient_context
+        self.shared_messages = {}
+        per_send, self.per_recipient_processors = get_context_processors()
+        self.send_context = run_context_processors(per_send)
+
+    def update_context(self, context):
+        """
+        Adds the output of the context processors to a recipient's context.
+        """
+        if self.send_context or self.per_recipient_processors:
+            processed = dict(self.send_context)
+            processed.update(run_context_processors(self.per_recipient_processors))
+            context.update(processed)
+
+    def recipient_values(self, context):
+        values = []
+        for variable in self.recipient_context:
+            try:
+                value = variable.resolve(context)
+            except VariableDoesNotExist:
+                value = None
+            try:
+                hash(value)
+            except TypeError:
+                return None
+            values.append(value)
+        return tuple(values)
+
+    def render(self, formats, context, media_slug=None):
+        if self.recipient_context is None:
+            return get_formatted_message(
+                formats, self.notice_type, context, media_slug, False)
+        values = self.recipient_values(context)
+        if values is None:
+            return get_formatted_message(
+                formats, self.notice_type, context, media_slug, False)
+        key = (get_language(), media_slug, tuple(formats), values)
+        try:
+            return self.shared_messages[key]
+        except KeyError:
+            if len(self.shared_messages) >= self.max_shared_messages:
+                self.shared_messages.clear()
+            messages = self.shared_messages[key] = get_formatted_message(
+                formats, self.notice_type, context, media_slug, False)
+            return messages
+
+
+def iter_recipient_ids(users, notice_type, groups=True, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Yields the ids of the recipients of a notice, ``users`` (a QuerySet or an
+    iterable of users) and, if ``groups`` is True, the members of the groups
+    of ``notice_type``, in lists of at most ``chunk_size`` ids. Every user is
+    yielded only once and group members are read a chunk at a time.
+    """
+    User = get_user_model()
+    group_ids = []
+    if groups:
+        group_ids = list(notice_type.groups.values_list("pk", flat=True))
+    if isinstance(users, QuerySet) and not users.query.can_filter():
+        # a sliced queryset can't be reordered or filtered, walk it as it is
+        users = list(users)
+    if isinstance(users, QuerySet):
+        if group_ids:
+            users = User._default_manager.filter(
+                Q(pk__in=users.values("pk")) | Q(groups__in=group_ids))
+        for user_ids in iter_distinct_ids(users, chunk_size):
+            yield user_ids
+        return
+    seen = set()
+    for chunk in chunked(users, chunk_size):
+        user_ids = []
+        for user in chunk:
+            if user.pk not in seen:
+                seen.add(user.pk)
+                user_ids.append(user.pk)
+        if user_ids:
+            yield user_ids
+    if group_ids:
+        members = User._default_manager.filter(groups__in=group_ids)
+        for user_ids in iter_distinct_ids(members, chunk_size):
+            user_ids = [user_id for user_id in user_ids if user_id not in seen]
+            if user_ids:
+                yield user_ids
+
+def iter_distinct_ids(queryset, chunk_size):
+    """
+    Yields the distinct primary keys of ``queryset`` in ascending lists of at
+    most ``chunk_size`` keys, one query per list.
+    """
+    queryset = queryset.order_by("pk").values_list("pk", flat=True).distinct()
+    last = None
+    while True:
+        if last is None:
+            user_ids = list(queryset[:chunk_size])
+        else:
+            user_ids = list(queryset.filter(pk__gt=last)[:chunk_size])
+        if not user_ids:
+            return
+        yield user_ids
+        last = user_ids[-1]
+
+def iter_recipients(users, notice_type, groups=True, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Like iter_recipient_ids, but yields lists of users. The user objects
+    passed in are reused, the others are loaded with one query per chunk.
+    """
+    if isinstance(users, QuerySet) and users.query.can_filter():
+        given = {}
+    else:
+        users = list(users)
+        given = dict((user.pk, user) for user in users)
+    User = get_user_model()
+    for user_ids in iter_recipient_ids(users, notice_type, groups, chunk_size):
+        missing = [user_id for user_id in user_ids if user_id not in given]
+        found = missing and User._default_manager.in_bulk(missing) or {}
+        chunk = []
+        for user_id in user_ids:
+            user = given.get(user_id) or found.get(user_id)
+            if user is not None:
+                chunk.append(user)
+        if chunk:
+            yield chunk
+
+def chunked(iterable, size):
+    """
+    Splits ``iterable`` into lists of at most ``size`` items.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def send_now(users, label, extra_context=None, on_site=None, sender=None, related_object_id=None, groups=True, backends=None, bulk=None, recipient_context=None, async_delivery=None):
     """
     Creates a new notice.
 
@@ -352,81 +667,184 @@ def send_now(users, label, extra_context=None, on_site=None, sender=None, relate
 
     You can pass in on_site=False to prevent the notice emitted from being
     displayed on the site.
+
+    Pass bulk=True (or set NOTIFICATION_BULK_SEND) to send to large lists of
+    users with a constant number of queries per NOTIFICATION_BULK_CHUNK_SIZE
+    recipients.
+
+    recipient_context lists the context keys that differ between recipients
+    (see NoticeRenderer), overriding NOTIFICATION_RECIPIENT_CONTEXT.
+
+    Pass async_delivery=True (or set NOTIFICATION_ASYNC_DELIVERY) to return as
+    soon as the notices are stored and leave the delivery through the backends
+    to background threads (see notification.delivery). This implies bulk.
     """
     if extra_context is None:
         extra_context = {}
+    if bulk is None:
+        bulk = BULK_SEND
+    if async_delivery is None:
+        async_delivery = ASYNC_DELIVERY
 
     notice_type = NoticeType.objects.get(label=label)
+    if recipient_context is None:
+        recipient_context = notice_type.recipient_context
+    renderer = NoticeRenderer(notice_type, recipient_context)
 
     protocol = getattr(settings, "DEFAULT_HTTP_PROTOCOL", "http")
     current_site = Site.objects.get_current()
 
     current_language = get_language()
 
-    if groups:
-        # Only send to groups if groups is True
-        for group in notice_type.groups.all():
-            if isinstance(users, QuerySet):
-                users = users | group.user_set.all()
-            else:
-                users += group.user_set.all()
-
-    for user in users:
-        # get user language for user from language store defined in
-        # NOTIFICATION_LANGUAGE_MODULE setting
-        try:
-            language = get_notification_language(user)
-        except LanguageStoreNotAvailable:
-            language = None
-
-        if language is not None:
-            # activate the user's language
-            activate(language)
-
-        # update context with user specific translations
-        context = Context({
-            "recipient": user,
-            "sender": sender,
-            "notice": ugettext(notice_type.display),
-            "current_site": current_site,
-        })
-        context.update(extra_context)
+    # Only send to groups if groups is True
+    recipients = iter_recipients(users, notice_type, groups, BULK_CHUNK_SIZE)
+
+    if backends is None:
+        backends = get_backends()
+    elif len(backends) > 0 and isinstance(backends[0], basestring):
+        backends = get_backends(backends)
+
+    if bulk or async_delivery:
+        for chunk in recipients:
+            send_chunk(chunk, notice_type, extra_context, on_site, sender,
+                       related_object_id, backends, current_site, renderer,
+                       async_delivery)
+        # reset environment to original language
+        activate(current_language)
+        return
+
+    for chunk in recipients:
+        # get user languages from the language store defined in the
+        # NOTIFICATION_LANGUAGE_MODULE setting, activating each one once
+        for language, users_in_language in group_by_language(chunk):
+            activate(language or current_language)
+
+            for user in users_in_language:
+                # update context with user specific translations
+                context = Context({
+                    "recipient": user,
+                    "sender": sender,
+                    "notice": ugettext(notice_type.display),
+                    "current_site": current_site,
+                })
+                context.update(extra_context)
+                renderer.update_context(context)
         
-        messages = get_formatted_message(
-            ['notice.html'], notice_type, context, 'notice')
-        notice_setting = get_notification_setting(user, notice_type, 'email')
-        if on_site is None:
-            on_site = notice_setting.on_site
-        notice = Notice.objects.create(
-            recipient=user, message=messages['notice.html'], notice_type=notice_type,
-            on_site=on_site, sender=sender, related_object_id=related_object_id)
-
-        if len(backends) > 0 and isinstance(backends[0], str):
-            backends = get_backends(backends)
-
-        for backend in backends:
-            send_user_notification(user, notice_type, backend, context)
+                messages = renderer.render(['notice.html'], context, 'notice')
+                notice_setting = get_notification_setting(user, notice_type, 'email')
+                user_on_site = on_site
+                if user_on_site is None:
+                    user_on_site = notice_setting.on_site
+                notice = Notice.objects.create(
+                    recipient=user, message=messages['notice.html'], notice_type=notice_type,
+                    on_site=user_on_site, sender=sender, related_object_id=related_object_id)
+                if counts_as_unseen(notice):
+                    change_unseen_count(user.pk, 1)
+
+                for backend in backends:
+                    send_user_notification(user, notice_type, backend, context, renderer)
 
     # reset environment to original language
     activate(current_language)
 
-def send_user_notification(user, notice_type, backend, context):
+def send_chunk(users, notice_type, extra_context, on_site, sender, related_object_id, backends, current_site, renderer=None, async_delivery=False):
+    """
+    Sends a notice to a list of users, prefetching all of their NoticeSettings
+    with one query and writing their Notices with ``bulk_create``.
+    """
+    if renderer is None:
+        renderer = NoticeRenderer(notice_type)
+    media = ['email'] + [backend.slug for backend in backends if backend.slug != 'email']
+    notice_settings = get_notification_settings_for(users, [notice_type], media)
+
+    # the recipients each backend delivers to; messages are only rendered
+    # for them.
+    eligible = {}
+    for backend in backends:
+        eligible[backend.slug] = set(
+            user.pk for user in users if user.is_active and
+            notice_settings[(user.pk, notice_type.pk, backend.slug)].send)
+
+    notices = []
+    deliveries = dict((backend.slug, []) for backend in backends)
+    # activate each language once and render everyone speaking it together
+    current_language = get_language()
+    for language, users_in_language in group_by_language(users):
+        activate(language or current_language)
+
+        for user in users_in_language:
+            context = Context({
+                "recipient": user,
+                "sender": sender,
+                "notice": ugettext(notice_type.display),
+                "current_site": current_site,
+            })
+            context.update(extra_context)
+            renderer.update_context(context)
+
+            messages = renderer.render(['notice.html'], context, 'notice')
+            user_on_site = on_site
+            if user_on_site is None:
+                user_on_site = notice_settings[(user.pk, notice_type.pk, 'email')].on_site
+            notices.append(Notice(
+                recipient=user, message=messages['notice.html'], notice_type=notice_type,
+                on_site=user_on_site, sender=sender, related_object_id=related_object_id))
+
+            for backend in backends:
+                # render while the user's language is active, deliver once the
+                # notices are stored.
+                if user.pk in eligible[backend.slug]:
+                    message = renderer.render(backend.formats, context, backend.slug)
+                    deliveries[backend.slug].append((message, [user]))
+
+    Notice.objects.bulk_create(notices, batch_size=BULK_CHUNK_SIZE)
+    for notice in notices:
+        if counts_as_unseen(notice):
+            change_unseen_count(notice.recipient_id, 1)
+
+    for backend in backends:
+        if not deliveries[backend.slug]:
+            continue
+        if async_delivery:
+            delivery.submit(backend, deliveries[backend.slug])
+        else:
+            deliver_notifications(backend, deliveries[backend.slug])
+
+def send_user_notification(user, notice_type, backend, context, renderer=None):
 
-    recipients = []
+    if not (user.is_active and should_send(user, notice_type, backend.slug)):
+        return
+
+    if renderer is None:
+        renderer = NoticeRenderer(notice_type)
+        renderer.update_context(context)
 
     # get prerendered format messages
-    message = get_formatted_message(
-        backend.formats, notice_type, context, backend.slug)
+    message = renderer.render(backend.formats, context, backend.slug)
 
-    if user.is_active and should_send(user, notice_type, backend.slug):
-        recipients.append(user)
+    deliver_notification(backend, message, [user])
 
-    if recipients:
-        try:
-            backend.send(message, recipients)
-        except TypeError, e:
-            print u"Tried to send notification to media %s. Send function raised an error." % (backend.title,)
-            raise e
+def deliver_notification(backend, message, recipients):
+    try:
+        backend.send(message, recipients)
+    except TypeError, e:
+        print u"Tried to send notification to media %s. Send function raised an error." % (backend.title,)
+        raise e
+
+def deliver_notifications(backend, messages):
+    """
+    Delivers a list of ``(message, recipients)`` tuples through ``backend``
+    in one go, if it supports it.
+    """
+    if not hasattr(backend, 'send_batch'):
+        for message, recipients in messages:
+            deliver_notification(backend, message, recipients)
+        return
+    try:
+        backend.send_batch(messages)
+    except TypeError, e:
+        print u"Tried to send notification to media %s. Send function raised an error." % (backend.title,)
+        raise e
 
 
 def send(*args, **kwargs):
@@ -450,31 +868,27 @@ def send(*args, **kwargs):
         else:
             return send_now(*args, **kwargs)
         
-def queue(users, label, extra_context=None, on_site=True, sender=None, related_object_id=None):
+def queue(users, label, extra_context=None, on_site=True, sender=None, related_object_id=None, recipient_context=None, bulk=None, async_delivery=None):
     """
     Queue the notification in NoticeQueueBatch. This allows for large amounts
     of user notifications to be deferred to a seperate process running outside
     the webserver.
+
+    ``bulk`` and ``async_delivery`` are accepted so ``send`` can pass on
+    its arguments; the queue worker sends queued notices in bulk and waits
+    for their delivery.
     """
     if extra_context is None:
         extra_context = {}
-    if isinstance(users, QuerySet):
-        users = [row["pk"] for row in users.values("pk")]
-    else:
-        users = [user.pk for user in users]
         
     notice_type = NoticeType.objects.get(label=label)
-    for group in notice_type.groups.all():
-        if isinstance(users, QuerySet):
-            users = users | group.user_set.all()
-        else:
-            users += group.user_set.all()
+    user_ids = []
+    for chunk in iter_recipient_ids(users, notice_type):
+        user_ids.extend(chunk)
 
-    notices = []
-    for user in users:
-        notices.append(
-            (user, label, extra_context, on_site, sender, related_object_id))
-    NoticeQueueBatch(pickled_data=pickle.dumps(notices).encode("base64")).save()
+    payload = QueuePayload(label, extra_context, on_site, sender,
+                           related_object_id, recipient_context, user_ids)
+    NoticeQueueBatch(payload=payload.encode()).save()
 
 class ObservedItemManager(models.Manager):
 
@@ -542,12 +956,24 @@ def stop_observing(observed, observer, signal='post_save'):
 def send_observation_notices_for(observed, signal='post_save', extra_context=None):
     """
     Send a notice for each registered user about an observed object.
+
+    The observers are grouped by notice type and every group is sent its
+    notice with a single bulk ``send``.
     """
     if extra_context is None:
         extra_context = {}
-    observed_items = ObservedItem.objects.all_for(observed, signal)
+    extra_context.update({'observed': observed})
+    observed_items = ObservedItem.objects.all_for(observed, signal).select_related('user', 'notice_type')
+    notice_types = []
+    observers = {}
     for observed_item in observed_items:
-        observed_item.send_notice(extra_context)
+        notice_type = observed_item.notice_type
+        if notice_type.pk not in observers:
+            observers[notice_type.pk] = []
+            notice_types.append(notice_type)
+        observers[notice_type.pk].append(observed_item.user)
+    for notice_type in notice_types:
+        send(observers[notice_type.pk], notice_type.label, extra_context, bulk=True)
     return observed_items
 
 
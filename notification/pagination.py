@@ -0,0 +1,96 @@
+"""
+Cursor based pagination of notices.
+
+Pages are found by their position in the (added, id) order instead of an
+OFFSET, so deep pages are as cheap as the first one and no COUNT(*) is run.
+The cursors handed to the templates are opaque tokens.
+"""
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(notice):
+    return base64.urlsafe_b64encode("%s|%s" % (notice.added.isoformat(), notice.pk))
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (added, id) position encoded in ``cursor``, or None if it is
+    not a valid cursor.
+    """
+    try:
+        added, pk = base64.urlsafe_b64decode(str(cursor)).split("|")
+        added, pk = parse_datetime(added), int(pk)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        return None
+    if added is None:
+        return None
+    return added, pk
+
+
+class CursorPage(object):
+    """
+    A page of notices, with the cursors of the pages around it.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return "<CursorPage of %s items>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_by_cursor(queryset, after=None, before=None, per_page=15):
+    """
+    Returns the CursorPage of ``queryset``, newest first, following the
+    cursor ``after`` or preceding the cursor ``before``. Without a (valid)
+    cursor the first page is returned.
+    """
+    after = after and decode_cursor(after)
+    before = before and decode_cursor(before)
+    if before:
+        added, pk = before
+        notices = list(queryset.filter(
+            Q(added__gt=added) | Q(added=added, pk__gt=pk)
+        ).order_by("added", "pk")[:per_page + 1])
+        has_previous = len(notices) > per_page
+        notices = notices[:per_page]
+        notices.reverse()
+        has_next = True
+    else:
+        if after:
+            added, pk = after
+            queryset = queryset.filter(Q(added__lt=added) | Q(added=added, pk__lt=pk))
+        notices = list(queryset.order_by("-added", "-pk")[:per_page + 1])
+        has_next = len(notices) > per_page
+        notices = notices[:per_page]
+        has_previous = bool(after)
+    next_cursor = previous_cursor = None
+    if notices:
+        if has_next:
+            next_cursor = encode_cursor(notices[-1])
+        if has_previous:
+            previous_cursor = encode_cursor(notices[0])
+    return CursorPage(notices, next_cursor, previous_cursor)
@@ -0,0 +1,152 @@
+"""
+Encoding of queued notices stored in NoticeQueueBatch.
+
+A batch used to be a base64 encoded pickle of one tuple per recipient,
+repeating the label, context and flags of the notice for every one of them.
+It is now stored as::
+
+    magic (3 bytes) | version (1 byte) | id size (1 byte) | shared length (4 bytes)
+    pickled shared fields | recipient ids, little endian, id size bytes each
+
+so that the shared fields are stored once and the recipient ids can be
+decoded a chunk at a time without unpickling the whole batch.
+"""
+import struct
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+MAGIC = "NQB"
+VERSION = 1
+
+HEADER = struct.Struct("<3sBBI")
+ID_FORMATS = {4: "I", 8: "Q"}
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def to_bytes(data):
+    """
+    Returns the content of a BinaryField value, which depending on the
+    database is a str, a buffer or a memoryview.
+    """
+    if hasattr(data, "tobytes"):
+        return data.tobytes()
+    return str(data)
+
+
+class QueuePayload(object):
+    """
+    A notice queued for a list of recipients.
+    """
+
+    def __init__(self, label, extra_context=None, on_site=True, sender=None,
+                 related_object_id=None, recipient_context=None, recipient_ids=()):
+        self.label = label
+        self.extra_context = extra_context or {}
+        self.on_site = on_site
+        self.sender = sender
+        self.related_object_id = related_object_id
+        self.recipient_context = recipient_context
+        self._ids = list(recipient_ids)
+        self._data = None
+        self._offset = self._size = self._count = 0
+
+    def __len__(self):
+        if self._data is None:
+            return len(self._ids)
+        return self._count
+
+    def iter_recipient_ids(self, start=0, chunk_size=1000):
+        """
+        Yields the recipient ids, starting at position ``start``, in lists of
+        at most ``chunk_size`` ids.
+        """
+        if self._data is None:
+            for i in range(start, len(self._ids), chunk_size):
+                yield self._ids[i:i + chunk_size]
+            return
+        for i in range(start, self._count, chunk_size):
+            count = min(chunk_size, self._count - i)
+            yield list(struct.unpack_from(
+                "<%d%s" % (count, ID_FORMATS[self._size]),
+                self._data, self._offset + i * self._size))
+
+    def shared_fields(self):
+        sender_id = getattr(self.sender, "pk", self.sender)
+        return {
+            "label": self.label,
+            "extra_context": self.extra_context,
+            "on_site": self.on_site,
+            "sender_id": sender_id,
+            "related_object_id": self.related_object_id,
+            "recipient_context": self.recipient_context,
+        }
+
+    def encode(self):
+        ids = []
+        for chunk in self.iter_recipient_ids():
+            ids.extend(chunk)
+        size = 4
+        if ids and max(ids) > 0xffffffff:
+            size = 8
+        shared = pickle.dumps(self.shared_fields(), pickle.HIGHEST_PROTOCOL)
+        return "".join([
+            HEADER.pack(MAGIC, VERSION, size, len(shared)),
+            shared,
+            struct.pack("<%d%s" % (len(ids), ID_FORMATS[size]), *ids),
+        ])
+
+    @classmethod
+    def decode(cls, data):
+        data = to_bytes(data)
+        if len(data) < HEADER.size:
+            raise PayloadError("queued batch payload is truncated")
+        magic, version, size, shared_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise PayloadError("not a queued batch payload")
+        if version != VERSION:
+            raise PayloadError("unsupported queued batch payload version %s" % version)
+        if size not in ID_FORMATS:
+            raise PayloadError("unsupported recipient id size %s" % size)
+        offset = HEADER.size + shared_length
+        shared = pickle.loads(data[HEADER.size:offset])
+        payload = cls(
+            shared["label"], shared["extra_context"], shared["on_site"],
+            shared["sender_id"], shared["related_object_id"],
+            shared["recipient_context"])
+        payload._data = data
+        payload._offset = offset
+        payload._size = size
+        payload._count = (len(data) - offset) // size
+        return payload
+
+
+def decode_pickled(pickled_data):
+    """
+    Decodes a batch stored in the old base64 pickled format into a list of
+    payloads, one for every run of recipients sharing the same notice.
+    """
+    payloads = []
+    notices = pickle.loads(str(pickled_data).decode("base64"))
+    for notice in notices:
+        user, label, extra_context, on_site, sender = notice[:5]
+        # old queue() calls stored the group members as User objects
+        user = getattr(user, "pk", user)
+        related_object_id = None
+        if len(notice) > 5:
+            related_object_id = notice[5]
+        if payloads:
+            last = payloads[-1]
+            if (last.label, last.extra_context, last.on_site, last.sender, last.related_object_id) == \
+                    (label, extra_context, on_site, sender, related_object_id):
+                last._ids.append(user)
+                continue
+        payloads.append(QueuePayload(
+            label, extra_context, on_site, sender, related_object_id,
+            recipient_ids=[user]))
+    return payloads
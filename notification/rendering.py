@@ -0,0 +1,174 @@
+"""
+Caches used while rendering notices.
+
+Notice templates are looked up with a four-level fallback for every recipient
+and every backend, so the resolved and compiled template of each
+``(template_slug, media_slug, format)`` is kept for the lifetime of the
+process, together with the fallback names known not to exist.
+
+With DEBUG on, nothing is negatively cached and compiled templates are
+reloaded when their file changes, so edited and new templates are picked up
+without a restart. The file of a template is only known with TEMPLATE_DEBUG
+on as well, otherwise templates are not cached at all with DEBUG on.
+
+The NOTIFICATION_CONTEXT_PROCESSORS are imported once as well. Processors
+decorated with ``per_send`` are run once per send instead of once per
+recipient.
+"""
+import os
+import importlib
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader import find_template, get_template_from_string
+from django.test.signals import setting_changed
+
+# compiled templates keyed by template name, as (template, path, mtime) tuples
+_templates = {}
+
+# template names known not to exist
+_missing = set()
+
+# name of the template used for a (template_slug, media_slug, format), or None
+# when none of the fallbacks exist
+_resolved = {}
+
+TEMPLATE_CACHE_STATS = {"hits": 0, "misses": 0, "negative_hits": 0}
+
+# imported NOTIFICATION_CONTEXT_PROCESSORS, as a (per_send, per_recipient)
+# tuple of lists
+_context_processors = []
+
+
+def clear_template_cache():
+    _templates.clear()
+    _missing.clear()
+    _resolved.clear()
+
+
+def notice_template_names(template_slug, media_slug, format):
+    """
+    Returns the template names tried for a notice format, most specific first.
+    """
+    return (
+        'notification/%s/%s/%s' % (template_slug, media_slug, format),
+        'notification/%s/%s' % (template_slug, format),
+        'notification/%s/%s' % (media_slug, format),
+        'notification/%s' % format)
+
+
+def _is_stale(entry):
+    template, path, mtime = entry
+    try:
+        return os.path.getmtime(path) != mtime
+    except (OSError, TypeError):
+        return True
+
+
+def load_template(name):
+    """
+    Returns the compiled template called ``name`` or None if it does not exist.
+    """
+    if name in _missing:
+        return None
+    entry = _templates.get(name)
+    if entry is not None and not (settings.DEBUG and _is_stale(entry)):
+        return entry[0]
+    try:
+        source, origin = find_template(name)
+    except TemplateDoesNotExist:
+        if not settings.DEBUG:
+            _missing.add(name)
+        return None
+    if hasattr(source, 'render'):
+        template = source
+    else:
+        template = get_template_from_string(source, origin, name)
+    # loaders which compile the template return no origin, the template then
+    # carries it (with TEMPLATE_DEBUG on)
+    origin = origin or getattr(template, 'origin', None)
+    path, mtime = getattr(origin, 'name', None), None
+    if settings.DEBUG:
+        try:
+            mtime = os.path.getmtime(path)
+        except (OSError, TypeError):
+            # we can't tell when it changes, so don't keep it around
+            return template
+    _templates[name] = (template, path, mtime)
+    return template
+
+
+def get_notice_template(template_slug, media_slug, format):
+    """
+    Returns the compiled template used to render ``format`` of a notice type
+    for the given medium. Raises TemplateDoesNotExist if none of the fallback
+    templates exist.
+    """
+    key = (template_slug, media_slug, format)
+    name = _resolved.get(key, False)
+    if name is None:
+        TEMPLATE_CACHE_STATS["negative_hits"] += 1
+        raise TemplateDoesNotExist(', '.join(notice_template_names(*key)))
+    if name is not False:
+        template = load_template(name)
+        if template is not None:
+            TEMPLATE_CACHE_STATS["hits"] += 1
+            return template
+
+    TEMPLATE_CACHE_STATS["misses"] += 1
+    names = notice_template_names(*key)
+    for name in names:
+        template = load_template(name)
+        if template is not None:
+            if not settings.DEBUG:
+                _resolved[key] = name
+            return template
+    if not settings.DEBUG:
+        _resolved[key] = None
+    raise TemplateDoesNotExist(', '.join(names))
+
+
+def per_send(processor):
+    """
+    Marks a notification context processor whose output is the same for all
+    recipients of a notice, so it is run only once per send.
+    """
+    processor.notification_per_send = True
+    return processor
+
+
+def get_context_processors():
+    """
+    Returns the NOTIFICATION_CONTEXT_PROCESSORS as a ``(per_send,
+    per_recipient)`` tuple of lists of callables, importing them only once.
+    """
+    if not _context_processors:
+        per_send, per_recipient = [], []
+        for path in getattr(settings, "NOTIFICATION_CONTEXT_PROCESSORS", None) or ():
+            module, attrib = path.rsplit('.', 1)
+            processor = getattr(importlib.import_module(module), attrib)
+            if getattr(processor, "notification_per_send", False):
+                per_send.append(processor)
+            else:
+                per_recipient.append(processor)
+        _context_processors.append((per_send, per_recipient))
+    return _context_processors[0]
+
+
+def run_context_processors(processors):
+    """
+    Returns the merged output of ``processors``.
+    """
+    output = {}
+    for processor in processors:
+        output.update(processor())
+    return output
+
+
+def _setting_changed(sender, setting, **kwargs):
+    if setting in ("DEBUG", "TEMPLATE_DIRS", "TEMPLATE_LOADERS", "INSTALLED_APPS"):
+        clear_template_cache()
+    if setting == "NOTIFICATION_CONTEXT_PROCESSORS":
+        del _context_processors[:]
+
+setting_changed.connect(_setting_changed)
@@ -9,6 +9,9 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from notification.models import *
 from notification.decorators import basic_auth_required, simple_basic_auth_callback
 from notification.feeds import NoticeUserFeed
+from notification.pagination import paginate_by_cursor
+from notification.cache import counts_as_unseen, change_unseen_count, set_unseen_count, update_unseen_count
+from notification.cache import invalidate_settings
 from django.http.response import HttpResponse
 
 
@@ -24,7 +27,7 @@ def feed_for_user(request):
 
 
 @login_required
-def notices(request, template_name="notification/notices.html", extra_context=None, archived=False, unseen=None):
+def notices(request, template_name="notification/notices.html", extra_context=None, archived=False, unseen=None, pagination="page"):
     """
     The main notices index view.
     
@@ -35,21 +38,41 @@ def notices(request, template_name="notification/notices.html", extra_context=No
         notices
             A list of :model:`notification.Notice` objects that are not archived
             and to be displayed on the site.
+
+        pagination
+            ``"page"`` or ``"cursor"``, as passed to the view.
+
+    Optional arguments:
+
+        pagination
+            ``"page"`` (the default) paginates with page numbers taken from the
+            ``page`` GET parameter, ``notices`` is a
+            :class:`django.core.paginator.Page`. ``"cursor"`` paginates with
+            the ``after`` and ``before`` GET parameters instead, which avoids
+            counting the notices and gets no slower on deep pages. ``notices``
+            is a :class:`notification.pagination.CursorPage` then, whose
+            ``next_cursor`` and ``previous_cursor`` are the values of these
+            parameters for the adjacent pages.
     """
     notices = Notice.objects.notices_for(request.user, on_site=True, archived=archived, unseen=unseen)
-    paginator = Paginator(notices, 15)
-
-    page = request.GET.get('page')
-    try:
-        notices = paginator.page(page)
-    except PageNotAnInteger:
-        notices = paginator.page(1)
-    except EmptyPage:
-        notices = paginator.page(paginator.num_pages)
+    if pagination == "cursor":
+        notices = paginate_by_cursor(
+            notices, request.GET.get('after'), request.GET.get('before'), 15)
+    else:
+        paginator = Paginator(notices, 15)
+
+        page = request.GET.get('page')
+        try:
+            notices = paginator.page(page)
+        except PageNotAnInteger:
+            notices = paginator.page(1)
+        except EmptyPage:
+            notices = paginator.page(paginator.num_pages)
     context = {
         "notices": notices,
         "archived": archived,
-        "unseen": unseen
+        "unseen": unseen,
+        "pagination": pagination,
     }
     if extra_context:
         context.update(extra_context)
@@ -77,28 +100,51 @@ def notice_settings(request):
             value is ``True`` or ``False`` depending on a ``request.POST``
             variable called ``form_label``, whose valid value is ``on``.
     """
-    notice_types = NoticeType.objects.all()
+    notice_types = list(NoticeType.objects.all())
+    media = list(NoticeMediaListChoices())
+    user = request.user
+
+    def form_label(notice_type, medium_id):
+        return "%s_%s" % (notice_type.label, medium_id)
+
+    posted = None
+    if request.method == "POST":
+        posted = {}
+        for notice_type in notice_types:
+            for medium_id, medium_display in media:
+                posted[(user.pk, notice_type.pk, medium_id)] = \
+                    request.POST.get(form_label(notice_type, medium_id)) == "on"
+
+    # missing settings are created with the posted values right away
+    user_settings = get_notification_settings_for(
+        [user], notice_types, [medium_id for medium_id, medium_display in media], posted)
+
+    turn_on, turn_off = [], []
     settings_table = []
     for notice_type in notice_types:
         settings_row = []
-        for medium_id, medium_display in NoticeMediaListChoices():
-            form_label = "%s_%s" % (notice_type.label, medium_id)
-            setting = get_notification_setting(request.user, notice_type, medium_id)
-            if request.method == "POST":
-                if request.POST.get(form_label) == "on":
-                    if not setting.send:
-                        setting.send = True
-                        setting.save()
+        for medium_id, medium_display in media:
+            key = (user.pk, notice_type.pk, medium_id)
+            setting = user_settings[key]
+            if posted is not None and setting.send != posted[key]:
+                setting.send = posted[key]
+                if setting.send:
+                    turn_on.append(setting.pk)
                 else:
-                    if setting.send:
-                        setting.send = False
-                        setting.save()
-            settings_row.append((form_label, setting.send))
+                    turn_off.append(setting.pk)
+            settings_row.append((form_label(notice_type, medium_id), setting.send))
         settings_table.append({"notice_type": notice_type, "cells": settings_row})
+    if turn_on:
+        NoticeSetting.objects.filter(pk__in=turn_on).update(send=True)
+    if turn_off:
+        NoticeSetting.objects.filter(pk__in=turn_off).update(send=False)
+    if turn_on or turn_off:
+        # update() doesn't send post_save
+        invalidate_settings([user.pk])
     
     notice_settings = {
         "column_headers": [
-            medium_display for medium_id, medium_display in NoticeMediaListChoices()],
+            medium_display for medium_id, medium_display in media],
         "rows": settings_table,
     }
     
@@ -129,8 +175,10 @@ def single(request, id, mark_seen=True):
     notice = get_object_or_404(Notice, id=id)
     if notice.recipient == request.user: # Ensure Model.__eq__ checks if request.user isinstance notice.recipient 
         if mark_seen and notice.unseen:
+            was_unseen = counts_as_unseen(notice)
             notice.unseen = False
             notice.save()
+            update_unseen_count(notice, was_unseen)
         return render_to_response("notification/single.html", {
             "notice": notice,
         }, context_instance=RequestContext(request))
@@ -184,7 +232,10 @@ def delete(request, noticeid=None, next_page=None):
         try:
             notice = Notice.objects.get(id=noticeid)
             if request.user == notice.recipient or request.user.is_superuser:
+                was_unseen = counts_as_unseen(notice)
                 notice.delete()
+                if was_unseen:
+                    change_unseen_count(notice.recipient_id, -1)
             else:   # you can delete other users' notices
                     # only if you are superuser.
                 return HttpResponseRedirect(next_page)
@@ -200,6 +251,7 @@ def mark_all_seen(request):
     ``HttpResponseRedirect`` when complete. 
     """
     Notice.objects.notices_for(request.user, unseen=True).update(unseen=False)
+    set_unseen_count(request.user.pk, 0)
     return HttpResponseRedirect(reverse("notification_notices"))
 
 @login_required
@@ -210,6 +262,8 @@ def mark_seen(request, id):
     """
     notice = get_object_or_404(Notice, id=id, recipient=request.user)
     if notice.unseen:
+        was_unseen = counts_as_unseen(notice)
         notice.unseen = False
         notice.save()
+        update_unseen_count(notice, was_unseen)
     return HttpResponseRedirect(reverse("notification_notices"))
\ No newline at end of file